@@ -1,38 +1,208 @@
 import streamlit as st
+import heapq
 import json
 import os
-import random
+from functools import partial
+import tempfile
+import numpy as np
 import pandas as pd
 import time
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DATA_FILE = "swedish_words.json"
 COOLDOWN_SECONDS = 300
 ADMIN_PASSWORD = st.secrets.get("admin_password", "")
 LABELS = ["0%", "25%", "50%", "75%", "100%"]
+FLUSH_EVERY = 10
+SEEN_BUCKETS = ["Low (0–2)", "Medium (3–5)", "High (6+)"]
+WORD_COLUMNS = ["swedish", "english", "category", "label", "seen"]
+_MENU = (
+    "🧠 Learn New Words (Random)",
+    "📂 Flashcards by Category",
+    "🔁 English to Swedish Mode",
+    "➕ Add New Word",
+    "📖 View All Words",
+    "🛠️ Admin Panel"
+)
+_DEFAULT_RATIOS = MappingProxyType({
+    "0%": 0.6,
+    "25%": 0.2,
+    "50%": 0.15,
+    "75%": 0.0,
+    "100%": 0.05
+})
+_CARD_DIVIDER = "---"
+_ANSWER_TPL = "### {}"
+
+
+@st.cache_data(max_entries=1, show_spinner=False)
+def _load_words_cached(path, mtime):
+    if orjson is not None:
+        with open(path, "rb") as f:
+            words = orjson.loads(f.read())
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            words = json.load(f)
+    return words
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _swedish_index_cached(path, mtime):
+    # Read-only, so share one dict instead of unpickling a copy per lookup.
+    words = _load_words_cached(path, mtime)
+    swedish_lower_index = {}
+    for i, w in enumerate(words):
+        swedish_lower_index.setdefault(w["swedish"].casefold(), i)
+    return swedish_lower_index
 
 
 def load_words():
     if not os.path.exists(DATA_FILE):
         return []
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        words = json.load(f)
-    for w in words:
-        if "label" not in w:
-            w["label"] = "0%"
-        if "seen" not in w:
-            w["seen"] = 0
-    save_words(words)
-    return words
+    return _load_words_cached(DATA_FILE, os.path.getmtime(DATA_FILE))
+
+
+def _to_frame(words):
+    df = pd.DataFrame(words) if words else pd.DataFrame(columns=WORD_COLUMNS)
+    # Unknown labels would become NaN and vanish on the next save; treat
+    # them as "0%", the same migration ensure_schema writes to the file.
+    df["label"] = pd.Categorical(df["label"], categories=LABELS).fillna("0%")
+    # Arrow-backed text columns go to st.dataframe without another conversion.
+    return df.astype({
+        "seen": "uint16",
+        "swedish": "string[pyarrow]",
+        "english": "string[pyarrow]",
+        "category": "string[pyarrow]"
+    })
+
+
+def frame_to_records(df):
+    # Sparse columns such as the legacy "group" come back as NaN; leave
+    # them out of the words that never had them.
+    return [
+        {k: v for k, v in row.items() if not pd.isna(v)}
+        for row in df.to_dict("records")
+    ]
+
+
+@st.cache_data(max_entries=1, show_spinner=False)
+def _words_frame_cached(path, mtime):
+    words = _load_words_cached(path, mtime)
+    return _to_frame(words)
+
+
+def load_words_frame():
+    if not os.path.exists(DATA_FILE):
+        return _to_frame([])
+    return _words_frame_cached(DATA_FILE, os.path.getmtime(DATA_FILE))
+
+
+def ensure_schema():
+    if st.session_state.setdefault("_schema_ok", False):
+        return
+    words = load_words()
+    known = set(LABELS)
+    needs_migration = any(w.get("label") not in known or "seen" not in w for w in words)
+    if needs_migration:
+        for w in words:
+            if w.get("label") not in known:
+                w["label"] = "0%"
+            w.setdefault("seen", 0)
+        save_words(words)
+    st.session_state._schema_ok = True
 
 
 def save_words(words):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(words, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        data = orjson.dumps(words)
+    else:
+        data = json.dumps(words, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # Sessions share one process, so each save gets its own temp file next
+    # to the data file; swapping it in means a save is never torn.
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(DATA_FILE) + ".",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(DATA_FILE))
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; keep the data file's permissions.
+        mode = os.stat(DATA_FILE).st_mode & 0o777 if os.path.exists(DATA_FILE) else 0o644
+        os.chmod(tmp, mode)
+        os.replace(tmp, DATA_FILE)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _load_words_cached.clear()
+    _swedish_index_cached.clear()
+    _words_frame_cached.clear()
+
+
+def get_words_df():
+    # Reload whenever the file changed, e.g. another session added a word,
+    # then replay this session's unsaved draws on top of it.
+    mtime = os.path.getmtime(DATA_FILE) if os.path.exists(DATA_FILE) else None
+    if "words_df" not in st.session_state or st.session_state.words_mtime != mtime:
+        words_df = load_words_frame()
+        pending = st.session_state.pending_seen
+        if pending:
+            deltas = words_df["swedish"].map(pending).fillna(0)
+            words_df["seen"] = (words_df["seen"] + deltas).astype("uint16")
+        # Index this frame once so positions always match it. Labels only
+        # change through admin actions, which save and so trigger a reload.
+        by_category = words_df.groupby("category").indices
+        st.session_state.categories_index = {c: by_category[c] for c in sorted(by_category)}
+        by_label = words_df.groupby("label", observed=True).indices
+        st.session_state.label_buckets = {
+            label: by_label.get(label, np.empty(0, dtype=np.intp)) for label in LABELS
+        }
+        st.session_state.word_keys = {
+            "swedish": words_df["swedish"].to_numpy(),
+            "english": words_df["english"].to_numpy()
+        }
+        st.session_state.words_df = words_df
+        st.session_state.words_mtime = mtime
+    return st.session_state.words_df
 
 
-def word_exists(swedish_word):
+def mark_dirty(swedish_word):
+    pending = st.session_state.pending_seen
+    pending[swedish_word] = pending.get(swedish_word, 0) + 1
+    st.session_state.pending_writes += 1
+    if st.session_state.pending_writes >= FLUSH_EVERY:
+        flush_words()
+
+
+def flush_words():
+    # Apply the seen deltas to the file as it is now rather than writing the
+    # session's snapshot, which may be missing words saved since it loaded.
+    pending = st.session_state.pending_seen
+    if not pending:
+        return
     words = load_words()
-    return any(w["swedish"].lower() == swedish_word.lower() for w in words)
+    for w in words:
+        delta = pending.get(w["swedish"])
+        if delta:
+            w["seen"] += delta
+    save_words(words)
+    pending.clear()
+    st.session_state.pending_writes = 0
+
+
+def word_exists(swedish_word):
+    if not os.path.exists(DATA_FILE):
+        return False
+    swedish_lower_index = _swedish_index_cached(DATA_FILE, os.path.getmtime(DATA_FILE))
+    return swedish_word.casefold() in swedish_lower_index
 
 
 def add_word(swedish, english, category):
@@ -50,140 +220,195 @@ def add_word(swedish, english, category):
     return True
 
 
-def select_random_mixture(words, ratios):
-    result = []
-    pool = [w for w in words if w["label"] in ratios]
-    for label, ratio in ratios.items():
-        lw = [w for w in pool if w["label"] == label]
-        count = max(1, int(len(pool) * ratio))
-        result.extend(random.sample(lw, min(len(lw), count)))
-    random.shuffle(result)
-    return result
+@st.cache_resource
+def get_rng():
+    return np.random.default_rng()
 
 
-def render_flashcard(word, show_translation=False):
-    st.markdown(f"""
-    <div style="border: 2px solid #ccc; border-radius: 10px; padding: 40px; text-align: center; background-color: white; box-shadow: 2px 2px 10px rgba(0,0,0,0.1);">
-        <h2>{word['swedish']}</h2>
-        {"<hr /><p style='font-size:20px;'>" + word['english'] + "</p>" if show_translation else ""}
-    </div>
-    """, unsafe_allow_html=True)
+def pick_available(bucket, keys, cooling, rng):
+    # Cooling words are usually a small share of a bucket, so a few random
+    # probes almost always hit before we fall back to scanning it.
+    for i in bucket[rng.integers(len(bucket), size=min(len(bucket), 8))]:
+        if keys[i] not in cooling:
+            return i
+    available = [i for i in bucket if keys[i] not in cooling]
+    return available[rng.integers(len(available))] if available else None
 
 
-def reset_all_labels(words):
-    for word in words:
-        word["label"] = "0%"
-    save_words(words)
+def draw_word(ratios, rng, key, cooling):
+    buckets = st.session_state.label_buckets
+    keys = st.session_state.word_keys[key]
+    weights = dict(ratios)
+    while weights:
+        labels = list(weights)
+        p = np.fromiter(weights.values(), dtype=float)
+        # Zero-ratio labels are only drawn once every weighted one is spent.
+        p = p / p.sum() if p.sum() > 0 else None
+        label = labels[rng.choice(len(labels), p=p)]
+        del weights[label]
+        bucket = buckets.get(label, ())
+        if len(bucket):
+            selected = pick_available(bucket, keys, cooling, rng)
+            if selected is not None:
+                return selected
+    return None
 
 
-def reset_all_seen(words):
-    for word in words:
-        word["seen"] = 0
-    save_words(words)
+def expire_cooldowns(now):
+    heap = st.session_state.cooldown_heap
+    live = st.session_state.cooldown_set
+    while heap and heap[0][0] <= now:
+        live.discard(heapq.heappop(heap)[1])
+    return live
+
+
+def start_cooldown(key, now):
+    heapq.heappush(st.session_state.cooldown_heap, (now + COOLDOWN_SECONDS, key))
+    st.session_state.cooldown_set.add(key)
+
+
+def render_flashcard(word, show_translation=False, front="swedish", back="english"):
+    with st.container(border=True):
+        st.header(word[front])
+        if show_translation:
+            st.markdown(_CARD_DIVIDER)
+            st.markdown(_ANSWER_TPL.format(word[back]))
+
+
+def reset_all_labels(words_df):
+    words_df["label"] = pd.Categorical(["0%"] * len(words_df), categories=LABELS)
+    save_words(frame_to_records(words_df))
+
+
+def reset_all_seen(words_df):
+    words_df["seen"] = np.zeros(len(words_df), dtype="uint16")
+    save_words(frame_to_records(words_df))
 
 
-def group_by_seen(words):
-    grouped = {
-        "Low (0–2)": [],
-        "Medium (3–5)": [],
-        "High (6+)": []
-    }
-    for word in words:
-        if word["seen"] <= 2:
-            grouped["Low (0–2)"].append(word)
-        elif word["seen"] <= 5:
-            grouped["Medium (3–5)"].append(word)
+def group_by_seen(df):
+    buckets = pd.cut(df["seen"], bins=[-1, 2, 5, np.inf], labels=SEEN_BUCKETS)
+    return {b: df.index[buckets == b].tolist() for b in SEEN_BUCKETS}
+
+
+def export_json(words_df):
+    return json.dumps(frame_to_records(words_df), indent=2, ensure_ascii=False)
+
+
+def reveal_card():
+    # Runs before the fragment redraws, so the card shows revealed without
+    # needing an explicit rerun.
+    st.session_state.reveal = True
+
+
+@st.fragment
+def learn_fragment(ratios, rng):
+    words_df = get_words_df()
+    if "current_word" not in st.session_state:
+        st.session_state.current_word = None
+        st.session_state.reveal = False
+
+    if st.button("🔀 Draw New Word"):
+        now = time.time()
+        selected = draw_word(ratios, rng, "swedish", expire_cooldowns(now))
+        if selected is not None:
+            words_df.at[selected, "seen"] += 1
+            mark_dirty(words_df.at[selected, "swedish"])
+            st.session_state.current_word = words_df.loc[selected].to_dict()
+            st.session_state.reveal = False
+            start_cooldown(words_df.at[selected, "swedish"], now)
+        else:
+            st.warning("⚠️ No new words available right now. Please wait 5 minutes or add more.")
+
+    if st.session_state.current_word:
+        render_flashcard(st.session_state.current_word, st.session_state.reveal)
+        if not st.session_state.reveal:
+            st.button("👁️ Show Translation", on_click=reveal_card)
+
+
+@st.fragment
+def category_fragment(rng):
+    words_df = get_words_df()
+    categories_index = st.session_state.categories_index
+    selected_category = st.selectbox("Choose a category", list(categories_index))
+
+    filtered_words = categories_index.get(selected_category, ())
+    if st.button("🔀 Draw Word from Category"):
+        if len(filtered_words):
+            selected = filtered_words[rng.integers(len(filtered_words))]
+            words_df.at[selected, "seen"] += 1
+            mark_dirty(words_df.at[selected, "swedish"])
+            st.session_state.current_word = words_df.loc[selected].to_dict()
+            st.session_state.reveal = False
+        else:
+            st.warning("⚠️ No words in this category.")
+
+    if "current_word" in st.session_state and st.session_state.current_word:
+        render_flashcard(st.session_state.current_word, st.session_state.reveal)
+        if not st.session_state.reveal:
+            st.button("👁️ Show Translation", on_click=reveal_card)
+
+
+@st.fragment
+def en_sv_fragment(ratios, rng):
+    words_df = get_words_df()
+    if st.button("🔀 Draw English Word"):
+        now = time.time()
+        selected = draw_word(ratios, rng, "english", expire_cooldowns(now))
+        if selected is not None:
+            words_df.at[selected, "seen"] += 1
+            mark_dirty(words_df.at[selected, "swedish"])
+            st.session_state.current_word = words_df.loc[selected].to_dict()
+            st.session_state.reveal = False
+            start_cooldown(words_df.at[selected, "english"], now)
         else:
-            grouped["High (6+)"].append(word)
-    return grouped
+            st.warning("⚠️ No new words available right now. Please wait 5 minutes or add more.")
+
+    if "current_word" in st.session_state and st.session_state.current_word:
+        render_flashcard(
+            st.session_state.current_word, st.session_state.reveal,
+            front="english", back="swedish"
+        )
+
+        if not st.session_state.reveal:
+            st.button("👁️ Reveal Swedish", on_click=reveal_card)
 
 
 def main():
     st.set_page_config(page_title="Swedish Flashcards", layout="centered")
     st.title("📘 Swedish Flashcard App")
 
-    menu = st.sidebar.radio("Choose action", [
-      "🧠 Learn New Words (Random)",
-      "📂 Flashcards by Category",
-      "🔁 English to Swedish Mode",  # ← New menu option
-      "➕ Add New Word",
-      "📖 View All Words",
-      "🛠️ Admin Panel"
-    ])
-
+    menu = st.sidebar.radio("Choose action", _MENU)
 
-    words = load_words()
 
-    if "recently_seen" not in st.session_state:
-        st.session_state.recently_seen = {}
+    if "pending_writes" not in st.session_state:
+        st.session_state.pending_writes = 0
+        st.session_state.pending_seen = {}
 
-    if "ratios" not in st.session_state:
-        st.session_state.ratios = {
-            "0%": 0.6,
-            "25%": 0.2,
-            "50%": 0.15,
-            "75%": 0.0,
-            "100%": 0.05
-        }
+    ensure_schema()
 
-    if menu == "🧠 Learn New Words (Random)":
-        st.header("Flashcard Training")
-        now = time.time()
-        st.session_state.recently_seen = {
-            w: t for w, t in st.session_state.recently_seen.items()
-            if now - t < COOLDOWN_SECONDS
-        }
+    if st.session_state.get("last_menu") != menu:
+        flush_words()
+        st.session_state.last_menu = menu
+    if st.sidebar.button("💾 Flush Progress"):
+        flush_words()
 
-        available_words = [
-            w for w in select_random_mixture(words, st.session_state.ratios)
-            if w["swedish"] not in st.session_state.recently_seen
-        ]
+    words_df = get_words_df()
+    rng = get_rng()
 
-        if "current_word" not in st.session_state:
-            st.session_state.current_word = None
-            st.session_state.reveal = False
+    if "cooldown_heap" not in st.session_state:
+        st.session_state.cooldown_heap = []
+        st.session_state.cooldown_set = set()
 
-        if st.button("🔀 Draw New Word"):
-            if available_words:
-                selected = random.choice(available_words)
-                selected["seen"] += 1
-                save_words(words)
-                st.session_state.current_word = selected
-                st.session_state.reveal = False
-                st.session_state.recently_seen[selected["swedish"]] = now
-            else:
-                st.warning("⚠️ No new words available right now. Please wait 5 minutes or add more.")
+    if "ratios" not in st.session_state:
+        st.session_state.ratios = dict(_DEFAULT_RATIOS)
 
-        if st.session_state.current_word:
-            render_flashcard(st.session_state.current_word, st.session_state.reveal)
-            if not st.session_state.reveal:
-                show = st.button("👁️ Show Translation")
-                if show:
-                    st.session_state.reveal = True
-                    st.rerun()
+    if menu == "🧠 Learn New Words (Random)":
+        st.header("Flashcard Training")
+        learn_fragment(st.session_state.ratios, rng)
 
     elif menu == "📂 Flashcards by Category":
         st.header("Flashcards by Category")
-        categories = sorted(set(w["category"] for w in words if "category" in w))
-        selected_category = st.selectbox("Choose a category", categories)
-
-        filtered_words = [w for w in words if w["category"] == selected_category]
-        if st.button("🔀 Draw Word from Category"):
-            if filtered_words:
-                selected = random.choice(filtered_words)
-                st.session_state.current_word = selected
-                st.session_state.reveal = False
-                selected["seen"] += 1
-                save_words(words)
-            else:
-                st.warning("⚠️ No words in this category.")
-
-        if "current_word" in st.session_state and st.session_state.current_word:
-            render_flashcard(st.session_state.current_word, st.session_state.reveal)
-            if not st.session_state.reveal:
-                if st.button("👁️ Show Translation"):
-                    st.session_state.reveal = True
-                    st.rerun()
+        category_fragment(rng)
 
     elif menu == "➕ Add New Word":
         st.header("Add a New Word")
@@ -201,10 +426,16 @@ def main():
 
     elif menu == "📖 View All Words":
         st.header("📚 All Words in Dictionary")
-        if words:
-            df = pd.DataFrame(words)
-            df = df[["swedish", "english", "category", "label", "seen"]]
-            st.dataframe(df, use_container_width=True)
+        if not words_df.empty:
+            st.dataframe(words_df[WORD_COLUMNS], width="stretch")
+            # Only serialize when the download is actually requested.
+            st.download_button(
+                "⬇️ Export JSON",
+                partial(export_json, words_df),
+                file_name=DATA_FILE,
+                mime="application/json",
+                on_click="ignore"
+            )
         else:
             st.info("No words added yet.")
 
@@ -233,13 +464,18 @@ def main():
                 total_ratio += st.session_state.ratios[label]
             st.markdown(f"**Total Ratio: {total_ratio:.2f}**")
 
+            st.subheader("📈 Words by Seen Count")
+            seen_groups = group_by_seen(words_df)
+            for col, (bucket, indices) in zip(st.columns(len(SEEN_BUCKETS)), seen_groups.items()):
+                col.metric(bucket, len(indices))
+
             col1, col2 = st.columns(2)
             if col1.button("🔁 Reset All Labels to 0%"):
-                reset_all_labels(words)
+                reset_all_labels(words_df)
                 st.success("All word labels have been reset to 0%!")
                 st.rerun()
             if col2.button("🔁 Reset All Seen Counts to 0"):
-                reset_all_seen(words)
+                reset_all_seen(words_df)
                 st.success("All 'seen' counters have been reset to 0!")
                 st.rerun()
 
@@ -254,62 +490,33 @@ def main():
             new_seen_value = st.slider("Set new 'seen' value", 0, 20, 0)
 
             selected_indices = []
-            for idx, word in enumerate(words):
-                label_match = not selected_labels or word["label"] in selected_labels
-                seen_match = min_seen <= word["seen"] <= max_seen
-                if label_match or seen_match:
-                    is_selected = st.checkbox(
-                        f"{word['swedish']} ({word['label']}, seen: {word['seen']})", key=f"select_{idx}"
-                    )
-                    if is_selected:
-                        selected_indices.append(idx)
+            if not words_df.empty:
+                view = words_df[["swedish", "label", "seen"]]
+                if selected_labels:
+                    mask = words_df["label"].isin(selected_labels) | words_df["seen"].between(min_seen, max_seen)
+                    view = view[mask]
+                view = view.assign(selected=False)
+                edited = st.data_editor(
+                    view,
+                    column_config={"selected": st.column_config.CheckboxColumn("Select")},
+                    column_order=["selected", "swedish", "label", "seen"],
+                    disabled=["swedish", "label", "seen"],
+                    hide_index=True,
+                    key="bulk_editor"
+                )
+                selected_indices = edited.index[edited["selected"]].tolist()
 
             if st.button("✅ Apply Label and Seen Value to Selected"):
-                for idx in selected_indices:
-                    words[idx]["label"] = new_bulk_label
-                    words[idx]["seen"] = new_seen_value
-                save_words(words)
+                words_df.loc[selected_indices, "label"] = new_bulk_label
+                words_df.loc[selected_indices, "seen"] = new_seen_value
+                save_words(frame_to_records(words_df))
                 st.success("Updated selected word labels and seen values.")
                 st.rerun()
     
 
     elif menu == "🔁 English to Swedish Mode":
         st.header("English to Swedish Flashcard Training")
-        now = time.time()
-        st.session_state.recently_seen = {
-            w: t for w, t in st.session_state.recently_seen.items()
-            if now - t < COOLDOWN_SECONDS
-        }
-
-        available_words = [
-            w for w in select_random_mixture(words, st.session_state.ratios)
-            if w["english"] not in st.session_state.recently_seen
-        ]
-
-        if st.button("🔀 Draw English Word"):
-            if available_words:
-                selected = random.choice(available_words)
-                selected["seen"] += 1
-                save_words(words)
-                st.session_state.current_word = selected
-                st.session_state.reveal = False
-                st.session_state.recently_seen[selected["english"]] = now
-            else:
-                st.warning("⚠️ No new words available right now. Please wait 5 minutes or add more.")
-
-        if "current_word" in st.session_state and st.session_state.current_word:
-            word = st.session_state.current_word
-            st.markdown(f"""
-            <div style="border: 2px solid #ccc; border-radius: 10px; padding: 40px; text-align: center; background-color: white; box-shadow: 2px 2px 10px rgba(0,0,0,0.1);">
-                <h2>{word['english']}</h2>
-                {"<hr /><p style='font-size:20px;'>" + word['swedish'] + "</p>" if st.session_state.reveal else ""}
-            </div>
-            """, unsafe_allow_html=True)
-
-            if not st.session_state.reveal:
-                if st.button("👁️ Reveal Swedish"):
-                    st.session_state.reveal = True
-                    st.rerun()
+        en_sv_fragment(st.session_state.ratios, rng)
 
 
 if __name__ == "__main__":